@@ -1,8 +1,24 @@
-from flask import Flask, request, jsonify, render_template
-from typing import Dict, Any, List, Set, Optional
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
+from typing import Dict, Any, Iterable, Iterator, List, Set, Optional, Tuple
 from pathlib import Path
+from xml.sax.saxutils import escape, quoteattr
+import csv
+import io
+import itertools
 import json
-from collections import deque
+import math
+import os
+import threading
+import time
+import zlib
+from collections import defaultdict, deque
+
+import click
+
+try:
+    import fcntl  # Verrou inter-workers (POSIX uniquement)
+except ImportError:
+    fcntl = None
 
 app = Flask(__name__)
 
@@ -48,6 +64,94 @@ DATA_FILE_PATH = Path(__file__).parent / "genealogy_data.json"
 personnes_et_relations = load_genealogy_data(DATA_FILE_PATH)
 
 
+# Nombre de bits à 1 (int.bit_count dès Python 3.10, sans passer par une chaîne)
+popcount = int.bit_count if hasattr(int, "bit_count") else (lambda bits: bin(bits).count("1"))
+
+
+# -----------------------------
+# Budget de travail des parcours
+# -----------------------------
+class WorkBudget:
+    """
+    Borne un parcours : nœuds visités (`max_nodes`), nœuds produits (`max_output`)
+    et durée (`timeout`, en secondes). Une fois dépassé, `visit()`/`emit()` renvoient
+    False et le parcours s'arrête en laissant un résultat partiel signalé par `report()`.
+    """
+    def __init__(self, max_nodes: Optional[int] = None, max_output: Optional[int] = None, timeout: Optional[float] = None):
+        self.max_nodes, self.max_output, self.timeout = max_nodes, max_output, timeout
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.visited = self.output = 0
+        self.exceeded: Optional[str] = None
+
+    def _allows(self, visited: int, output: int) -> bool:
+        if self.exceeded is None:
+            if self.max_nodes is not None and visited > self.max_nodes:
+                self.exceeded = "max_nodes"
+            elif self.max_output is not None and output > self.max_output:
+                self.exceeded = "max_output"
+            elif self.deadline is not None and time.monotonic() > self.deadline:
+                self.exceeded = "deadline"
+        return self.exceeded is None
+
+    # Les compteurs ne comptent que le travail accepté : `report()` décrit ce qui a réellement été produit
+    def visit(self, count: int = 1) -> bool:
+        if not self._allows(self.visited + count, self.output):
+            return False
+        self.visited += count
+        return True
+
+    def emit(self, count: int = 1) -> bool:
+        if not self._allows(self.visited, self.output + count):
+            return False
+        self.output += count
+        return True
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "truncated": self.exceeded is not None,
+            "reason": self.exceeded,
+            "visited": self.visited,
+            "output": self.output,
+            "limits": {"max_nodes": self.max_nodes, "max_output": self.max_output, "timeout": self.timeout}
+        }
+
+
+# -----------------------------
+# Index spatial (grille uniforme)
+# -----------------------------
+class SpatialGrid:
+    """Grille uniforme : insertion O(1), requête proportionnelle aux cellules couvertes par la fenêtre."""
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], List[Tuple[str, float, float]]] = defaultdict(list)
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def insert(self, key: str, x: float, y: float):
+        self.cells[self._cell(x, y)].append((key, x, y))
+
+    def query(self, x0: float, y0: float, x1: float, y1: float) -> Iterator[Tuple[str, float, float]]:
+        (cx0, cy0), (cx1, cy1) = self._cell(x0, y0), self._cell(x1, y1)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self.cells):
+            # Fenêtre plus large que l'arbre : parcourir seulement les cellules occupées
+            cells = [c for c in self.cells if cx0 <= c[0] <= cx1 and cy0 <= c[1] <= cy1]
+        else:
+            cells = [(i, j) for i in range(cx0, cx1 + 1) for j in range(cy0, cy1 + 1)]
+        for cell in cells:
+            for key, x, y in self.cells.get(cell, ()):
+                if x0 <= x <= x1 and y0 <= y <= y1:
+                    yield key, x, y
+
+
+# Disposition stable côté serveur (unités du monde SVG)
+LAYOUT_NODE_SPACING = 140
+LAYOUT_LEVEL_SPACING = 200
+# En dessous de ce zoom, les personnes sont regroupées en grappes d'environ LOD_CLUSTER_PIXELS à l'écran
+LOD_ZOOM_THRESHOLD = 0.5
+LOD_CLUSTER_PIXELS = 80
+
+
 # -----------------------------
 # Gestionnaire de données
 # -----------------------------
@@ -55,6 +159,8 @@ class FamilyDataManager:
     def __init__(self, data: Dict[str, Dict[str, Any]]):
         self.data = data
         self._process_data()
+        self._compute_aggregates()
+        self._compute_layout()
 
     def _process_data(self):
         """Crée relations bidirectionnelles : parents/enfants ET conjoints"""
@@ -79,72 +185,376 @@ class FamilyDataManager:
                     if name not in self.data[conjoint]["conjoints"]:
                         self.data[conjoint]["conjoints"].append(name)
 
+    # -----------------------------
+    # Agrégats précalculés (programmation dynamique sur le DAG)
+    # -----------------------------
+    def _components(self) -> Dict[str, int]:
+        """Numéro de composante connexe (liens parent/enfant) de chaque personne."""
+        component: Dict[str, int] = {}
+        cid = 0
+        for start in self.data:
+            if start in component: continue
+            cid += 1
+            component[start], stack = cid, [start]
+            while stack:
+                person = stack.pop()
+                for r in self.data[person].get("parents", []) + self.data[person].get("enfants", []):
+                    if r in self.data and r not in component:
+                        component[r] = cid
+                        stack.append(r)
+        return component
+
+    def _strongly_connected_components(self) -> List[List[str]]:
+        """
+        Composantes fortement connexes du graphe parent → enfant (Tarjan itératif).
+        Sans cycle, chaque personne forme sa propre composante. Ordre des données conservé.
+        """
+        data_index = {n: i for i, n in enumerate(self.data)}
+        children = lambda n: [e for e in self.data[n].get("enfants", []) if e in self.data]
+        index, low, on_stack, stack, sccs = {}, {}, set(), [], []
+        for root in self.data:
+            if root in index: continue
+            index[root] = low[root] = len(index)
+            stack.append(root); on_stack.add(root)
+            work = [(root, iter(children(root)))]
+            while work:
+                person, pending = work[-1]
+                for e in pending:
+                    if e not in index:
+                        index[e] = low[e] = len(index)
+                        stack.append(e); on_stack.add(e)
+                        work.append((e, iter(children(e))))
+                        break
+                    if e in on_stack:
+                        low[person] = min(low[person], index[e])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[person])
+                    if low[person] == index[person]:
+                        scc = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            scc.append(member)
+                            if member == person: break
+                        sccs.append(sorted(scc, key=data_index.get))
+        sccs.sort(key=lambda scc: data_index[scc[0]])
+        return sccs
+
+    def _topological_order(self) -> List[List[str]]:
+        """
+        Composantes fortement connexes en ordre parents → enfants (Kahn sur le graphe condensé).
+        Seules les arêtes internes à un cycle échappent à l'ordre ; tout ce qui suit un cycle reste placé après lui.
+        """
+        sccs = self._strongly_connected_components()
+        scc_of = {n: i for i, scc in enumerate(sccs) for n in scc}
+        successors: List[List[int]] = [[] for _ in sccs]
+        in_degree = [0] * len(sccs)
+        for i, scc in enumerate(sccs):
+            for person in scc:
+                for e in self.data[person].get("enfants", []):
+                    j = scc_of.get(e)
+                    if j is not None and j != i:
+                        successors[i].append(j)
+                        in_degree[j] += 1
+        queue = deque(i for i, d in enumerate(in_degree) if d == 0)
+        order = []
+        while queue:
+            i = queue.popleft()
+            order.append(sccs[i])
+            for j in successors[i]:
+                in_degree[j] -= 1
+                if in_degree[j] == 0:
+                    queue.append(j)
+        return order
+
+    def _compute_aggregates(self):
+        """
+        Calcule une seule fois, pour chaque personne : nombre de descendants, nombre d'ancêtres,
+        profondeur maximale en dessous et nombre de conjoints.
+        Les ensembles de descendants/ancêtres sont des bitsets (entiers Python) fusionnés par OU :
+        un descendant partagé par deux branches n'est compté qu'une fois.
+        Les membres d'un même cycle sont tous ancêtres et descendants les uns des autres (comme le
+        parcours en largeur) ; la profondeur ne compte que les arêtes qui sortent du cycle.
+        Chaque composante connexe occupe une plage contiguë de l'ordre topologique et ses bitsets sont
+        relatifs au début de cette plage : leur largeur est bornée par la taille de la composante
+        (coût O(N·C/64) en temps et en mémoire, C = taille de la plus grande composante).
+        """
+        component = self._components()
+        # Tri stable : l'ordre topologique est conservé à l'intérieur de chaque composante
+        sccs = sorted(self._topological_order(), key=lambda scc: component[scc[0]])
+        order = [n for scc in sccs for n in scc]
+        scc_of = {n: i for i, scc in enumerate(sccs) for n in scc}
+        self._bit_order = order
+        self._bit_index = {n: i for i, n in enumerate(order)}
+        self._bit_offset = {}
+        for i, n in enumerate(order):
+            self._bit_offset[n] = i if i == 0 or component[order[i - 1]] != component[n] else self._bit_offset[order[i - 1]]
+        position, offset = self._bit_index, self._bit_offset
+        bit = lambda n: 1 << (position[n] - offset[n])
+        # Bitsets des membres conservés seulement pour les cycles (un entier 1 << k coûte k bits)
+        cycles = {i: sum(bit(n) for n in scc) for i, scc in enumerate(sccs) if len(scc) > 1}
+        members = lambda i: cycles[i] if i in cycles else bit(sccs[i][0])
+
+        def closure(indices, relation):
+            """Bitsets de chaque composante selon `relation`, en ignorant les arêtes internes à un cycle."""
+            bits_of, depth_of = [0] * len(sccs), [0] * len(sccs)
+            for i in indices:
+                bits, depth = 0, 0
+                for person in sccs[i]:
+                    for r in self.data[person].get(relation, []):
+                        j = scc_of.get(r)
+                        if j is not None and j != i:
+                            bits |= members(j) | bits_of[j]
+                            depth = max(depth, depth_of[j] + 1)
+                bits_of[i], depth_of[i] = bits, depth
+            return bits_of, depth_of
+
+        # Descendants + profondeur : des feuilles vers les racines ; ancêtres : des racines vers les feuilles
+        descendants_scc, depth_scc = closure(reversed(range(len(sccs))), "enfants")
+        ancestors_scc, _ = closure(range(len(sccs)), "parents")
+
+        descendants_bits, ancestors_bits, depth_below = {}, {}, {}
+        for n in order:
+            i = scc_of[n]
+            cycle = cycles[i] & ~bit(n) if i in cycles else 0
+            descendants_bits[n] = descendants_scc[i] | cycle if cycle else descendants_scc[i]
+            ancestors_bits[n] = ancestors_scc[i] | cycle if cycle else ancestors_scc[i]
+            depth_below[n] = depth_scc[i]
+
+        self._descendants_bits, self._ancestors_bits = descendants_bits, ancestors_bits
+        self.aggregates = {
+            n: {
+                "descendant_count": popcount(descendants_bits[n]),
+                "ancestor_count": popcount(ancestors_bits[n]),
+                "max_depth_below": depth_below[n],
+                "spouse_count": sum(1 for c in self.data[n].get("conjoints", []) if c in self.data),
+            }
+            for n in order
+        }
+
+    def get_aggregates(self, name: str) -> Dict[str, int]:
+        return self.aggregates.get(name, {"descendant_count": 0, "ancestor_count": 0, "max_depth_below": 0, "spouse_count": 0})
+
+    # -----------------------------
+    # Index d'accessibilité (fermeture transitive en bitsets)
+    # -----------------------------
+    def is_ancestor(self, ancestor: str, descendant: str) -> bool:
+        """Test en un ET binaire sur la fermeture transitive, quelle que soit la distance."""
+        if ancestor not in self._bit_index or descendant not in self._bit_index:
+            return False
+        if self._bit_offset[ancestor] != self._bit_offset[descendant]:
+            return False
+        return bool(self._descendants_bits[ancestor] >> (self._bit_index[descendant] - self._bit_offset[descendant]) & 1)
+
+    def generation_distance(self, ancestor: str, descendant: str, budget: Optional[WorkBudget] = None) -> Optional[int]:
+        """
+        Nombre minimal de générations entre `ancestor` et `descendant`, ou None.
+        Le parcours ne suit que les enfants dont l'index garantit qu'ils mènent à `descendant`.
+        """
+        budget = budget or WorkBudget()
+        if not self.is_ancestor(ancestor, descendant):
+            return None
+        queue, visited = deque([(ancestor, 0)]), {ancestor}
+        while queue:
+            person, depth = queue.popleft()
+            if not budget.visit(): return None
+            for e in self.data[person].get("enfants", []):
+                if e == descendant:
+                    return depth + 1
+                if e not in visited and self.is_ancestor(e, descendant):
+                    visited.add(e)
+                    queue.append((e, depth + 1))
+        return None
+
+    def _names_from_bits(self, bits: int, offset: int, reverse: bool = False) -> Iterator[str]:
+        """Noms du bitset dans l'ordre topologique, ou inverse (du plus proche au plus lointain ancêtre)."""
+        while bits:
+            if reverse:
+                position = bits.bit_length() - 1
+                bits ^= 1 << position
+            else:
+                low = bits & -bits
+                position = low.bit_length() - 1
+                bits ^= low
+            yield self._bit_order[offset + position]
+
+    # -----------------------------
+    # Disposition stable et index spatial
+    # -----------------------------
+    def _compute_layout(self):
+        """
+        Place chaque personne une seule fois : y = génération (plus long chemin depuis une racine),
+        x = prochaine place libre de sa génération, jamais à gauche de son premier parent placé.
+        Les coordonnées ne dépendent que des données, donc restent stables d'une requête à l'autre.
+        """
+        generation: Dict[str, int] = {}
+        for person in self._bit_order:
+            parent_gens = [generation[p] + 1 for p in self.data[person].get("parents", []) if p in generation]
+            generation[person] = max(parent_gens, default=0)
+
+        # Ordre de placement : parcours en profondeur depuis les racines, fratries groupées
+        roots = [n for n in self._bit_order if not any(p in self.data for p in self.data[n].get("parents", []))]
+        placement, seen = [], set()
+        stack = list(reversed(roots))
+        while stack:
+            person = stack.pop()
+            if person in seen: continue
+            seen.add(person)
+            placement.append(person)
+            stack.extend(c for c in reversed(self.data[person].get("enfants", [])) if c in self.data and c not in seen)
+        placement.extend(n for n in self._bit_order if n not in seen)
+
+        slot: Dict[str, int] = {}
+        next_free: Dict[int, int] = defaultdict(int)
+        for person in placement:
+            gen = generation[person]
+            parent_slots = [slot[p] for p in self.data[person].get("parents", []) if p in slot]
+            slot[person] = max(next_free[gen], min(parent_slots, default=0))
+            next_free[gen] = slot[person] + 1
+
+        self.layout = {n: (slot[n] * LAYOUT_NODE_SPACING, generation[n] * LAYOUT_LEVEL_SPACING) for n in placement}
+        self._layout_grid = SpatialGrid(4 * LAYOUT_NODE_SPACING)
+        for n, (x, y) in self.layout.items():
+            self._layout_grid.insert(n, x, y)
+        xs, ys = [x for x, _ in self.layout.values()], [y for _, y in self.layout.values()]
+        self._layout_bounds = {"x0": min(xs, default=0), "y0": min(ys, default=0), "x1": max(xs, default=0), "y1": max(ys, default=0)}
+
+    def get_layout_bounds(self) -> Dict[str, float]:
+        return dict(self._layout_bounds)
+
+    def get_viewport(self, x0: float, y0: float, x1: float, y1: float, zoom: float = 1.0,
+                     budget: Optional[WorkBudget] = None) -> Dict[str, Any]:
+        """Personnes et liens visibles dans la fenêtre ; regroupés en grappes quand le zoom est faible."""
+        budget = budget or WorkBudget()
+        x0, x1 = sorted((x0, x1))
+        y0, y1 = sorted((y0, y1))
+        lod = zoom < LOD_ZOOM_THRESHOLD
+        visible: Dict[str, Tuple[float, float]] = {}
+        for name, x, y in self._layout_grid.query(x0, y0, x1, y1):
+            if not budget.visit() or (not lod and not budget.emit()):
+                break
+            visible[name] = (x, y)
+
+        payload = self._viewport_clusters(visible, zoom, budget) if lod else self._viewport_detail(visible)
+        payload.update({
+            "viewport": {"x0": x0, "y0": y0, "x1": x1, "y1": y1, "zoom": zoom},
+            "lod": lod,
+            "bounds": self.get_layout_bounds(),
+            "budget": budget.report()
+        })
+        return payload
+
+    def _viewport_detail(self, visible: Dict[str, Tuple[float, float]]) -> Dict[str, Any]:
+        nodes = [
+            {"id": n, "name": n, "gender": self.data[n].get("genre", "Inconnu"), "x": x, "y": y, **self.get_aggregates(n)}
+            for n, (x, y) in visible.items()
+        ]
+        # Liens dont au moins une extrémité est visible, avec les coordonnées des deux extrémités
+        edges = set(self._iter_links(visible, self.data))
+        for n in visible:
+            edges.update((p, n, "parent") for p in self.data[n].get("parents", []) if p in self.data and p not in visible)
+            edges.update((c, n, "spouse") for c in self.data[n].get("conjoints", []) if c in self.data and c not in visible and c < n)
+        links = [{"source": a, "target": b, "type": t, "points": [*self.layout[a], *self.layout[b]]} for a, b, t in sorted(edges)]
+        return {"nodes": nodes, "links": links}
+
+    def _viewport_clusters(self, visible: Dict[str, Tuple[float, float]], zoom: float, budget: WorkBudget) -> Dict[str, Any]:
+        size = LOD_CLUSTER_PIXELS / max(zoom, 1e-3)
+        cell_of = {n: (int(x // size), int(y // size)) for n, (x, y) in visible.items()}
+        clusters: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        for n, (x, y) in visible.items():
+            cluster = clusters.setdefault(cell_of[n], {"count": 0, "sx": 0.0, "sy": 0.0, "members": []})
+            cluster["count"] += 1
+            cluster["sx"] += x
+            cluster["sy"] += y
+            cluster["members"].append(n)
+
+        nodes = []
+        for (i, j), c in clusters.items():
+            if not budget.emit():
+                break
+            # La personne qui a le plus de descendants représente la grappe
+            representative = max(c["members"], key=lambda m: self.get_aggregates(m)["descendant_count"])
+            nodes.append({
+                "id": f"cluster:{i}:{j}", "cluster": True, "name": representative, "count": c["count"],
+                "x": c["sx"] / c["count"], "y": c["sy"] / c["count"]
+            })
+
+        weights: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        for a, b, t in self._iter_links(visible, visible):
+            if cell_of[a] != cell_of[b]:
+                weights[("cluster:%d:%d" % cell_of[a], "cluster:%d:%d" % cell_of[b], t)] += 1
+        links = [{"source": a, "target": b, "type": t, "count": w} for (a, b, t), w in weights.items()]
+        return {"nodes": nodes, "links": links}
+
     # -----------------------------
     # Hiérarchie : chaque enfant rattaché à TOUS ses parents
     # -----------------------------
-    def build_clean_hierarchy_server(self) -> List[Dict[str, Any]]:
-        def build_person_node(person_name: str, visited: Set[str] = None) -> Optional[Dict[str, Any]]:
-            if visited is None:
-                visited = set()
-            if person_name in visited:
-                return None
-            if person_name not in self.data:
-                return None
+    def build_clean_hierarchy_server(self, budget: Optional[WorkBudget] = None) -> List[Dict[str, Any]]:
+        budget = budget or WorkBudget()
+        # Racines = personnes sans parents
+        roots = [name for name, info in self.data.items() if not info.get("parents", [])]
 
-            person = self.data[person_name]
-            new_path = visited | {person_name}
+        # Parcours en profondeur itératif (pas de limite de récursion) : (personne, chemin, liste où l'ajouter)
+        hierarchy: List[Dict[str, Any]] = []
+        stack = [(root, frozenset(), hierarchy) for root in reversed(roots)]
+        while stack:
+            person_name, path, siblings = stack.pop()
+            if person_name in path or person_name not in self.data:
+                continue
+            if not budget.visit() or not budget.emit():
+                break
 
+            person = self.data[person_name]
             node = {
                 "id": person_name,
                 "name": person_name,
                 "genre": person.get("genre", "Inconnu"),
-                "children": []
+                "children": [],
+                **self.get_aggregates(person_name)
             }
+            siblings.append(node)
 
             # Ajouter tous les enfants (sans empêcher plusieurs rattachements)
-            for child_name in person.get("enfants", []):
+            new_path = path | {person_name}
+            for child_name in reversed(person.get("enfants", [])):
                 if child_name in self.data:
-                    child_node = build_person_node(child_name, new_path)
-                    if child_node:
-                        node["children"].append(child_node)
-
-            return node
-
-        # Racines = personnes sans parents
-        roots = [name for name, info in self.data.items() if not info.get("parents", [])]
-
-        hierarchy = []
-        for root in roots:
-            root_node = build_person_node(root)
-            if root_node:
-                hierarchy.append(root_node)
+                    stack.append((child_name, new_path, node["children"]))
 
         return hierarchy
 
-    def get_hierarchical_tree_clean(self) -> Dict[str, Any]:
+    def get_hierarchical_tree_clean(self, budget: Optional[WorkBudget] = None) -> Dict[str, Any]:
+        budget = budget or WorkBudget()
         return {
-            "hierarchy": self.build_clean_hierarchy_server(),
+            "hierarchy": self.build_clean_hierarchy_server(budget),
             "personnes": [
                 {
                     "name": name,
                     "genre": info.get("genre", "Inconnu"),
                     "parents": info.get("parents", []),
                     "enfants": info.get("enfants", []),
-                    "conjoints": info.get("conjoints", [])
+                    "conjoints": info.get("conjoints", []),
+                    **self.get_aggregates(name)
                 }
                 for name, info in self.data.items()
-            ]
+            ],
+            "budget": budget.report()
         }
 
     # -----------------------------
     # Hiérarchie limitée en profondeur
     # -----------------------------
-    def get_hierarchical_tree_limited(self, max_depth: int = 10) -> Dict[str, Any]:
+    def get_hierarchical_tree_limited(self, max_depth: int = 10, budget: Optional[WorkBudget] = None) -> Dict[str, Any]:
+        budget = budget or WorkBudget()
         def build_limited(person_name: str, depth: int = 0, visited: Set[str] = None) -> Optional[Dict[str, Any]]:
             if visited is None:
                 visited = set()
             if person_name in visited or person_name not in self.data or depth >= max_depth:
                 return None
+            if not budget.visit() or not budget.emit():
+                return None
 
             visited.add(person_name)
             person = self.data[person_name]
@@ -154,7 +564,8 @@ class FamilyDataManager:
                 "genre": person.get("genre", "Inconnu"),
                 "children": [],
                 "depth": depth,
-                "has_more_children": False
+                "has_more_children": False,
+                **self.get_aggregates(person_name)
             }
 
             for child in person.get("enfants", []):
@@ -169,7 +580,7 @@ class FamilyDataManager:
         roots = [n for n, info in self.data.items() if not info.get("parents", [])][:3]
         hierarchy = [build_limited(r) for r in roots if r]
 
-        return {"hierarchy": hierarchy, "max_depth": max_depth, "total_roots": len(roots)}
+        return {"hierarchy": [h for h in hierarchy if h], "max_depth": max_depth, "total_roots": len(roots), "budget": budget.report()}
 
     # -----------------------------
     # Accès et recherche
@@ -197,19 +608,35 @@ class FamilyDataManager:
             "parents_details": [{"name": p, "gender": self.data[p].get("genre", "Inconnu")} for p in info.get("parents", []) if p in self.data],
             "children_details": [{"name": c, "gender": self.data[c].get("genre", "Inconnu")} for c in info.get("enfants", []) if c in self.data],
             "spouses_details": [{"name": s, "gender": self.data[s].get("genre", "Inconnu")} for s in info.get("conjoints", []) if s in self.data],
+            **self.get_aggregates(name),
         }
 
     # -----------------------------
     # Arbres / sous-ensembles
     # -----------------------------
-    def _get_related_people(self, start: str, direction: str, max_depth: int = 5) -> Set[str]:
+    def _get_related_people(self, start: str, direction: str, max_depth: Optional[int] = None, budget: Optional[WorkBudget] = None) -> Set[str]:
+        budget = budget or WorkBudget()
         if start not in self.data:
             return set()
+        if max_depth is None:
+            # Sans limite de profondeur : lecture directe de l'index d'accessibilité.
+            # Les ancêtres sont lus du plus proche au plus lointain (descendants : l'inverse) :
+            # un résultat tronqué reste ainsi un sous-graphe connexe autour de `start`.
+            ancestors = direction == "ancestors"
+            bits = (self._ancestors_bits if ancestors else self._descendants_bits)[start]
+            related = set()
+            for person in itertools.chain((start,), self._names_from_bits(bits, self._bit_offset[start], reverse=ancestors)):
+                if not budget.emit():
+                    break
+                related.add(person)
+            return related
         visited, to_visit = set(), deque([(start, 0)])
         while to_visit:
             person, depth = to_visit.popleft()
             if person in visited or depth > max_depth:
                 continue
+            if not budget.visit() or not budget.emit():
+                break
             visited.add(person)
             rel = self.data[person].get("parents" if direction == "ancestors" else "enfants", [])
             for r in rel:
@@ -217,41 +644,172 @@ class FamilyDataManager:
                     to_visit.append((r, depth + 1))
         return visited
 
-    def _get_family_subset(self, name: str, direction: str) -> Dict[str, Any]:
-        related = self._get_related_people(name, direction)
-        nodes = [{"id": n, "name": n, "gender": self.data[n].get("genre", "Inconnu")} for n in related if n in self.data]
-        links = []
-        for n in related:
+    def _get_family_subset(self, name: str, direction: str, budget: Optional[WorkBudget] = None) -> Dict[str, Any]:
+        budget = budget or WorkBudget()
+        related = self._get_related_people(name, direction, budget=budget)
+        nodes = [{"id": n, "name": n, "gender": self.data[n].get("genre", "Inconnu"), **self.get_aggregates(n)} for n in related if n in self.data]
+        links = [{"source": a, "target": b, "type": t} for a, b, t in self._iter_links(related, related)]
+        return {"nodes": nodes, "links": links, "budget": budget.report()}
+
+    def _iter_links(self, people: Iterable[str], members) -> Iterator[Tuple[str, str, str]]:
+        """Liens (source, cible, type) entre personnes de `members` ; chaque couple n'est émis qu'une fois."""
+        for n in people:
             for e in self.data.get(n, {}).get("enfants", []):
-                if e in related: links.append({"source": n, "target": e, "type": "parent"})
+                if e in members: yield n, e, "parent"
             for c in self.data.get(n, {}).get("conjoints", []):
-                if c in related and n < c: links.append({"source": n, "target": c, "type": "spouse"})
-        return {"nodes": nodes, "links": links}
+                if c in members and n < c: yield n, c, "spouse"
 
-    def get_ancestors(self, name: str): return self._get_family_subset(name, "ancestors")
-    def get_descendants(self, name: str): return self._get_family_subset(name, "descendants")
-    def get_hierarchical_tree(self): return self.get_hierarchical_tree_clean()
-
-    def get_full_tree(self) -> Dict[str, Any]:
-        nodes = self.get_all_people()
-        links = []
-        for n, i in self.data.items():
-            for e in i.get("enfants", []):
-                if e in self.data: links.append({"source": n, "target": e, "type": "parent"})
-            for c in i.get("conjoints", []):
-                if c in self.data and n < c: links.append({"source": n, "target": c, "type": "spouse"})
-        return {"nodes": nodes, "links": links}
+    def get_ancestors(self, name: str, budget: Optional[WorkBudget] = None): return self._get_family_subset(name, "ancestors", budget)
+    def get_descendants(self, name: str, budget: Optional[WorkBudget] = None): return self._get_family_subset(name, "descendants", budget)
+    def get_hierarchical_tree(self, budget: Optional[WorkBudget] = None): return self.get_hierarchical_tree_clean(budget)
+
+    def get_full_tree(self, budget: Optional[WorkBudget] = None) -> Dict[str, Any]:
+        budget = budget or WorkBudget()
+        people = []
+        for n in self.data:
+            if not budget.emit():
+                break
+            people.append(n)
+        members = self.data if len(people) == len(self.data) else set(people)
+        nodes = [{"id": n, "name": n, "gender": self.data[n].get("genre", "Inconnu"), **self.get_aggregates(n)} for n in people]
+        links = [{"source": a, "target": b, "type": t} for a, b, t in self._iter_links(people, members)]
+        return {"nodes": nodes, "links": links, "budget": budget.report()}
+
+    # -----------------------------
+    # Export en flux (GraphML, CSV, GEDCOM)
+    # -----------------------------
+    def iter_export(self, fmt: str, name: Optional[str] = None, direction: str = "descendants",
+                    budget: Optional[WorkBudget] = None) -> Iterator[str]:
+        """
+        Génère l'export morceau par morceau, sans construire les listes nodes/links.
+        Sans `name`, tout l'arbre est exporté ; sinon le sous-graphe ancêtres/descendants de `name`,
+        sélectionné avant le premier morceau (le `budget` peut donc être vérifié avant l'envoi).
+        """
+        if name is None:
+            people, members = self.data.keys(), self.data
+        else:
+            members = self._get_related_people(name, direction, budget=budget)
+            people = sorted(members, key=self._bit_index.get)
+        writers = {"graphml": self._iter_graphml, "csv": self._iter_csv, "gedcom": self._iter_gedcom}
+        return writers[fmt](people, members)
+
+    def _iter_graphml(self, people: Iterable[str], members) -> Iterator[str]:
+        yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+               '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+               '  <key id="gender" for="node" attr.name="gender" attr.type="string"/>\n'
+               '  <key id="type" for="edge" attr.name="type" attr.type="string"/>\n'
+               '  <graph id="famille" edgedefault="directed">\n')
+        for n in people:
+            yield f'    <node id={quoteattr(n)}><data key="gender">{escape(self.data[n].get("genre", "Inconnu"))}</data></node>\n'
+        for a, b, t in self._iter_links(people, members):
+            yield f'    <edge source={quoteattr(a)} target={quoteattr(b)}><data key="type">{t}</data></edge>\n'
+        yield '  </graph>\n</graphml>\n'
+
+    def _iter_csv(self, people: Iterable[str], members) -> Iterator[str]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(["source", "target", "type"])
+        for row in self._iter_links(people, members):
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    def _gedcom_couple(self, parents: Iterable[str]) -> Tuple[Tuple[str, str], ...]:
+        """
+        (balise, personne) d'une famille GEDCOM : au plus un HUSB et une WIFE.
+        GEDCOM 5.5.1 n'a que deux rôles : au-delà de deux parents, seuls les deux premiers (ordre alphabétique)
+        sont écrits ; pour deux parents de même genre, le premier est HUSB et le second WIFE.
+        """
+        couple = sorted(parents)[:2]
+        genre = [self.data[p].get("genre") for p in couple]
+        if not couple:
+            return ()
+        if len(couple) == 1:
+            return (("WIFE" if genre[0] == "Femme" else "HUSB", couple[0]),)
+        if (genre[0] == "Femme" and genre[1] != "Femme") or (genre[1] == "Homme" and genre[0] != "Homme"):
+            couple.reverse()
+        return (("HUSB", couple[0]), ("WIFE", couple[1]))
+
+    def _iter_gedcom(self, people: Iterable[str], members) -> Iterator[str]:
+        # Les familles (couple + enfants) doivent être connues avant d'écrire les individus (FAMS/FAMC)
+        families: Dict[Tuple[Tuple[str, str], ...], Dict[str, List[str]]] = {}
+        for n in people:
+            parents = self._gedcom_couple(p for p in self.data[n].get("parents", []) if p in members)
+            if parents:
+                families.setdefault(parents, {"children": []})["children"].append(n)
+        for a, b, t in self._iter_links(people, members):
+            if t == "spouse":
+                families.setdefault(self._gedcom_couple((a, b)), {"children": []})
+
+        famc: Dict[str, str] = {}
+        fams: Dict[str, List[str]] = {}
+        for i, (couple, fam) in enumerate(families.items(), start=1):
+            fam["id"] = f"@F{i}@"
+            for _, p in couple: fams.setdefault(p, []).append(fam["id"])
+            for c in fam["children"]: famc[c] = fam["id"]
+
+        def indi(n: str) -> str:
+            return f"@I{self._bit_index[n]}@"
+
+        yield "0 HEAD\n1 SOUR ARBRE_GENEALOGIQUE\n1 GEDC\n2 VERS 5.5.1\n2 FORM LINEAGE-LINKED\n1 CHAR UTF-8\n"
+        for n in people:
+            sex = {"Homme": "M", "Femme": "F"}.get(self.data[n].get("genre"), "U")
+            # Le nom est un texte libre sans nom de famille distinct : écrit sans délimiteurs /Nom/
+            lines = [f"0 {indi(n)} INDI", f"1 NAME {n}", f"1 SEX {sex}"]
+            lines += [f"1 FAMS {f}" for f in fams.get(n, [])]
+            if n in famc: lines.append(f"1 FAMC {famc[n]}")
+            yield "\n".join(lines) + "\n"
+        for couple, fam in families.items():
+            lines = [f"0 {fam['id']} FAM"]
+            lines += [f"1 {tag} {indi(p)}" for tag, p in couple]
+            lines += [f"1 CHIL {indi(c)}" for c in fam["children"]]
+            yield "\n".join(lines) + "\n"
+        yield "0 TRLR\n"
+
+    # -----------------------------
+    # Statistiques
+    # -----------------------------
+    def get_stats(self, budget: Optional[WorkBudget] = None) -> Dict[str, Any]:
+        budget = budget or WorkBudget()
+        total, roots = len(self.data), [n for n, i in self.data.items() if not i.get("parents", [])]
+        generations, max_gen = {}, 0
+        # Chaque chemin racine → personne est compté ; pile explicite au lieu de la récursion
+        stack = [(r, 0, frozenset()) for r in roots]
+        while stack:
+            name, gen, path = stack.pop()
+            if name in path: continue
+            if not budget.visit(): break
+            generations[gen] = generations.get(gen, 0) + 1
+            max_gen = max(max_gen, gen)
+            for c in self.data.get(name, {}).get("enfants", []): stack.append((c, gen + 1, path | {name}))
+        genders = {}
+        for p in self.data.values():
+            g = p.get("genre", "Inconnu")
+            genders[g] = genders.get(g, 0) + 1
+        return {
+            "total_people": total,
+            "total_roots": len(roots),
+            "max_generations": max_gen + 1,
+            "generations_distribution": generations,
+            "gender_distribution": genders,
+            "roots": roots[:5],
+            "budget": budget.report()
+        }
 
     # -----------------------------
     # Plus court chemin
     # -----------------------------
-    def find_shortest_path(self, start: str, end: str) -> Optional[Dict[str, Any]]:
+    def find_shortest_path(self, start: str, end: str, budget: Optional[WorkBudget] = None) -> Optional[Dict[str, Any]]:
+        budget = budget or WorkBudget()
         if start not in self.data or end not in self.data:
             return None
         queue, visited = deque([(start, [start])]), set()
         while queue:
             current, path = queue.popleft()
             if current in visited: continue
+            if not budget.visit(): return None
             visited.add(current)
             if current == end:
                 nodes = [{"id": n, "name": n, "gender": self.data[n].get("genre", "Inconnu")} for n in path]
@@ -267,10 +825,155 @@ class FamilyDataManager:
         return None
 
 
+# -----------------------------
+# Coalescence des requêtes coûteuses (single-flight)
+# -----------------------------
+class _InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Les appels concurrents portant la même clé attendent un unique calcul en cours
+    et partagent son résultat. Si `lock_dir` est fourni, un verrou fichier (flock)
+    coalesce aussi les calculs entre workers gunicorn : quand d'autres workers attendent,
+    le premier écrit le résultat dans `lock_dir` et ils le relisent au lieu de recalculer.
+    Un calcul sans concurrent n'écrit rien ; un résultat périmé est supprimé au calcul suivant.
+    """
+    def __init__(self, lock_dir: Optional[str] = None):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _InFlightCall] = {}
+        self.lock_dir = Path(lock_dir) if lock_dir and fcntl else None
+        if self.lock_dir:
+            self.lock_dir.mkdir(parents=True, exist_ok=True)
+
+    def do(self, key: str, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _InFlightCall()
+
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_across_workers(key, fn) if self.lock_dir else fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _run_across_workers(self, key: str, fn):
+        safe_key = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in key)
+        lock_path = self.lock_dir / f"{safe_key}.lock"
+        result_path, waiting_path = lock_path.with_suffix(".json"), lock_path.with_suffix(".waiting")
+        started = time.time()
+        with open(lock_path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Un autre worker calcule déjà : se signaler puis attendre son résultat
+                waiting_path.touch()
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if result_path.exists():
+                    # Un autre worker a terminé le même calcul pendant qu'on attendait le verrou
+                    if result_path.stat().st_mtime >= started:
+                        with open(result_path, "r", encoding="utf-8") as f:
+                            return json.load(f)
+                    result_path.unlink(missing_ok=True)
+                result = fn()
+                # Le résultat n'est écrit sur disque que si un autre worker l'attend
+                if waiting_path.exists():
+                    tmp_path = result_path.with_suffix(f".{os.getpid()}.tmp")
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        json.dump(result, f, ensure_ascii=False)
+                    os.replace(tmp_path, result_path)
+                    waiting_path.unlink(missing_ok=True)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# -----------------------------
+# Export : encodage et compression à la volée
+# -----------------------------
+EXPORT_FORMATS = {
+    "graphml": ("application/graphml+xml", "graphml"),
+    "csv": ("text/csv", "csv"),
+    "gedcom": ("text/plain", "ged"),
+}
+
+# Taille des blocs envoyés au client : évite une écriture socket par ligne exportée
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+def encode_stream(chunks: Iterable[str], compress: bool = False) -> Iterator[bytes]:
+    """Encode en UTF-8, compresse en gzip si demandé, et regroupe la sortie en blocs d'environ EXPORT_CHUNK_SIZE octets."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    buffer = bytearray()
+    for chunk in chunks:
+        data = chunk.encode("utf-8")
+        buffer += compressor.compress(data) if compressor else data
+        if len(buffer) >= EXPORT_CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if compressor:
+        buffer += compressor.flush()
+    if buffer:
+        yield bytes(buffer)
+
+
 # -----------------------------
 # Initialisation
 # -----------------------------
 family_manager = FamilyDataManager(personnes_et_relations)
+single_flight = SingleFlight(os.environ.get("SINGLE_FLIGHT_DIR"))
+
+# Plafonds serveur des budgets de travail (un client peut seulement les abaisser)
+MAX_TRAVERSAL_NODES = int(os.environ.get("MAX_TRAVERSAL_NODES", 200000))
+MAX_OUTPUT_NODES = int(os.environ.get("MAX_OUTPUT_NODES", 50000))
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", 5.0))
+BUDGET_HINT = "Réduisez la requête : /api/hierarchical-tree-limited?depth=N, /api/ancestors/<nom> ou /api/descendants/<nom>."
+
+
+# -----------------------------
+# Budgets par requête
+# -----------------------------
+def request_budget() -> WorkBudget:
+    """Budget lu dans ?max_nodes=&max_output=&timeout=, borné par les plafonds serveur."""
+    def bounded(arg, cap, type_):
+        value = request.args.get(arg, type=type_)
+        return cap if value is None or not math.isfinite(value) or value <= 0 else min(value, cap)
+    return WorkBudget(
+        bounded("max_nodes", MAX_TRAVERSAL_NODES, int),
+        bounded("max_output", MAX_OUTPUT_NODES, int),
+        bounded("timeout", REQUEST_TIMEOUT, float),
+    )
+
+def budget_key(key: str, budget: WorkBudget) -> str:
+    return f"{key}|{budget.max_nodes}|{budget.max_output}|{budget.timeout}"
+
+def over_budget_response(report: Dict[str, Any]):
+    status = 503 if report.get("reason") == "deadline" else 413
+    return jsonify({"error": "Budget de calcul dépassé", "budget": report, "hint": BUDGET_HINT}), status
+
+def budgeted_response(payload: Dict[str, Any]):
+    """Résultat partiel signalé par `budget.truncated`, ou 413/503 si ?strict=1."""
+    report = payload.get("budget", {})
+    if report.get("truncated") and request.args.get("strict", "0") in ("1", "true"):
+        return over_budget_response(report)
+    return jsonify(payload)
 
 
 # -----------------------------
@@ -280,7 +983,20 @@ family_manager = FamilyDataManager(personnes_et_relations)
 def index(): return render_template("index.html")
 
 @app.route("/api/tree")
-def api_tree(): return jsonify(family_manager.get_full_tree())
+def api_tree():
+    budget = request_budget()
+    return budgeted_response(single_flight.do(budget_key("tree", budget), lambda: family_manager.get_full_tree(budget)))
+
+@app.route("/api/tree/viewport")
+def api_tree_viewport():
+    x0, y0, x1, y1 = (request.args.get(k, type=float) for k in ("x0", "y0", "x1", "y1"))
+    if None in (x0, y0, x1, y1): return jsonify({"error": "x0, y0, x1 et y1 sont requis"}), 400
+    # Zoom par défaut seulement s'il est absent : une valeur illisible est une erreur, comme pour les coordonnées
+    zoom = request.args.get("zoom", type=float) if "zoom" in request.args else 1.0
+    if zoom is None or not all(math.isfinite(v) for v in (x0, y0, x1, y1, zoom)):
+        return jsonify({"error": "x0, y0, x1, y1 et zoom doivent être des nombres finis"}), 400
+    if zoom <= 0: return jsonify({"error": "zoom doit être positif"}), 400
+    return budgeted_response(family_manager.get_viewport(x0, y0, x1, y1, zoom, request_budget()))
 
 @app.route("/api/person/<name>")
 def api_person(name):
@@ -288,21 +1004,59 @@ def api_person(name):
     return jsonify(p) if p else (jsonify({"error": "Personne non trouvée"}), 404)
 
 @app.route("/api/ancestors/<name>")
-def api_ancestors(name): return jsonify(family_manager.get_ancestors(name))
+def api_ancestors(name): return budgeted_response(family_manager.get_ancestors(name, request_budget()))
 
 @app.route("/api/descendants/<name>")
-def api_descendants(name): return jsonify(family_manager.get_descendants(name))
+def api_descendants(name): return budgeted_response(family_manager.get_descendants(name, request_budget()))
+
+@app.route("/api/export/<fmt>")
+def api_export(fmt):
+    if fmt not in EXPORT_FORMATS: return jsonify({"error": f"Format inconnu : {fmt}"}), 400
+    name, direction = request.args.get("person"), request.args.get("direction", "descendants")
+    if direction not in ("ancestors", "descendants"): return jsonify({"error": "Direction invalide"}), 400
+    if name is not None and name not in family_manager.data: return jsonify({"error": "Personne non trouvée"}), 404
+    compress = request.args.get("gzip", "0") in ("1", "true")
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    filename = f"arbre.{extension}" + (".gz" if compress else "")
+    budget = request_budget()
+    chunks = family_manager.iter_export(fmt, name, direction, budget)
+    # Le sous-graphe est déjà sélectionné : un export tronqué est refusé avant le premier octet
+    if budget.exceeded: return over_budget_response(budget.report())
+    return Response(
+        stream_with_context(encode_stream(chunks, compress)),
+        mimetype="application/gzip" if compress else mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.route("/api/is-ancestor")
+def api_is_ancestor():
+    a, d = request.args.get("ancestor"), request.args.get("descendant")
+    if not a or not d: return jsonify({"error": "Deux noms sont requis"}), 400
+    if a not in family_manager.data or d not in family_manager.data: return jsonify({"error": "Personne non trouvée"}), 404
+    budget = request_budget()
+    generations = family_manager.generation_distance(a, d, budget)
+    if budget.exceeded: return over_budget_response(budget.report())
+    return jsonify({
+        "ancestor": a,
+        "descendant": d,
+        "is_ancestor": family_manager.is_ancestor(a, d),
+        "generations": generations
+    })
 
 @app.route("/api/people")
 def api_people(): return jsonify(family_manager.get_all_people())
 
 @app.route("/api/hierarchical-tree")
-def api_hierarchical_tree(): return jsonify(family_manager.get_hierarchical_tree_clean())
+def api_hierarchical_tree():
+    budget = request_budget()
+    return budgeted_response(single_flight.do(budget_key("hierarchical-tree", budget), lambda: family_manager.get_hierarchical_tree_clean(budget)))
 
 @app.route("/api/hierarchical-tree-limited")
 def api_hierarchical_tree_limited():
     depth = min(request.args.get("depth", 4, type=int), 6)
-    return jsonify(family_manager.get_hierarchical_tree_limited(depth))
+    budget = request_budget()
+    return budgeted_response(single_flight.do(
+        budget_key(f"hierarchical-tree-limited-{depth}", budget), lambda: family_manager.get_hierarchical_tree_limited(depth, budget)))
 
 @app.route("/api/search")
 def api_search(): return jsonify(family_manager.search_people(request.args.get("q", "")))
@@ -311,7 +1065,9 @@ def api_search(): return jsonify(family_manager.search_people(request.args.get("
 def api_relation_path():
     p1, p2 = request.args.get("person1"), request.args.get("person2")
     if not p1 or not p2: return jsonify({"error": "Deux noms sont requis"}), 400
-    path = family_manager.find_shortest_path(p1, p2)
+    budget = request_budget()
+    path = family_manager.find_shortest_path(p1, p2, budget)
+    if budget.exceeded: return over_budget_response(budget.report())
     return jsonify(path) if path else (jsonify({"error": "Aucun chemin trouvé"}), 404)
 
 @app.route("/api/validate")
@@ -326,29 +1082,26 @@ def api_validate():
 
 @app.route("/api/stats")
 def api_stats():
-    total, roots = len(family_manager.data), [n for n, i in family_manager.data.items() if not i.get("parents", [])]
-    generations, max_gen = {}, 0
-    def calc(name, gen=0, visited=None):
-        nonlocal max_gen
-        visited = visited or set()
-        if name in visited: return
-        visited.add(name)
-        generations[gen] = generations.get(gen, 0) + 1
-        max_gen = max(max_gen, gen)
-        for c in family_manager.data.get(name, {}).get("enfants", []): calc(c, gen + 1, visited.copy())
-    for r in roots: calc(r)
-    genders = {}
-    for p in family_manager.data.values():
-        g = p.get("genre", "Inconnu")
-        genders[g] = genders.get(g, 0) + 1
-    return jsonify({
-        "total_people": total,
-        "total_roots": len(roots),
-        "max_generations": max_gen + 1,
-        "generations_distribution": generations,
-        "gender_distribution": genders,
-        "roots": roots[:5]
-    })
+    budget = request_budget()
+    return budgeted_response(single_flight.do(budget_key("stats", budget), lambda: family_manager.get_stats(budget)))
+
+
+# -----------------------------
+# CLI : flask --app app export ...
+# -----------------------------
+@app.cli.command("export")
+@click.option("--format", "fmt", type=click.Choice(list(EXPORT_FORMATS)), default="graphml", show_default=True)
+@click.option("--person", default=None, help="Exporter seulement les ancêtres/descendants de cette personne.")
+@click.option("--direction", type=click.Choice(["ancestors", "descendants"]), default="descendants", show_default=True)
+@click.option("--gzip", "compress", is_flag=True, help="Compresser la sortie en gzip.")
+@click.option("--output", "-o", default="-", help="Fichier de sortie (- pour la sortie standard).")
+def export_command(fmt, person, direction, compress, output):
+    """Exporte l'arbre (ou un sous-graphe) en GraphML, CSV ou GEDCOM."""
+    if person is not None and person not in family_manager.data:
+        raise click.BadParameter(f"Personne non trouvée : {person}", param_hint="--person")
+    with click.open_file(output, "wb") as out:
+        for chunk in encode_stream(family_manager.iter_export(fmt, person, direction), compress):
+            out.write(chunk)
 
 
 if __name__ == "__main__":
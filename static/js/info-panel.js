@@ -27,6 +27,7 @@ function showPersonDetails(event, d) {
                 <div class="info-row"><b>Parents :</b> ${formatList(parentsWithGender)}</div>
                 <div class="info-row"><b>Enfants :</b> ${formatList(childrenWithGender)}</div>
                 <div class="info-row"><b>Conjoints :</b> ${formatList(spousesWithGender)}</div>
+                <div class="info-row"><b>Descendants :</b> ${info.descendant_count ?? "—"} · <b>Ancêtres :</b> ${info.ancestor_count ?? "—"}</div>
             `;
 
             panel.classList.add("active");
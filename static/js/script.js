@@ -32,6 +32,7 @@ async function initFamilyView() {
         if (res.ok) {
             let data = await res.json();
             if (data && data.nodes && data.links) {
+                showBudgetNotice(data);
                 // Normaliser les noeuds (id/name/genre)
                 data.nodes = data.nodes.map(n => ({
                     id: n.id || n.name,
@@ -1350,6 +1351,7 @@ function showPersonDetails(event, d) {
                 <div class="info-row"><b>Parents :</b> ${formatList(parentsWithGender)}</div>
                 <div class="info-row"><b>Enfants :</b> ${formatList(childrenWithGender)}</div>
                 <div class="info-row"><b>Conjoints :</b> ${formatList(spousesWithGender)}</div>
+                <div class="info-row"><b>Descendants :</b> ${info.descendant_count ?? "—"} · <b>Ancêtres :</b> ${info.ancestor_count ?? "—"}</div>
             `;
 
             panel.classList.add("active");
@@ -1407,6 +1409,26 @@ function closePanel() {
     document.getElementById("overlay").classList.remove("active");
 }
 
+// ==========================
+// Avertissement : résultat partiel
+// ==========================
+const BUDGET_REASONS = {
+    max_nodes: "trop de personnes à parcourir",
+    max_output: "trop de personnes à afficher",
+    deadline: "calcul trop long"
+};
+
+function showBudgetNotice(data) {
+    const notice = document.getElementById("budget-notice");
+    if (data.budget?.truncated) {
+        notice.textContent = `⚠️ Arbre partiel (${BUDGET_REASONS[data.budget.reason] || data.budget.reason}) : `
+            + `${data.budget.output} personnes affichées. Recherchez une personne pour explorer ses ancêtres ou descendants.`;
+        notice.classList.add("active");
+    } else {
+        notice.classList.remove("active");
+    }
+}
+
 // ==========================
 // Boutons vue / recherche
 // ==========================
@@ -1417,6 +1439,7 @@ function fetchAndDraw(url, drawFn) {
             return res.json();
         })
         .then(data => {
+            showBudgetNotice(data);
             if (drawFn === drawHierarchicalTree) {
                 if (data.hierarchy && data.hierarchy.length > 0) {
                     drawFn(data.hierarchy);
@@ -0,0 +1,408 @@
+"""
+Tests pytest (sans serveur) des fonctions de performance : coalescence, budgets, index.
+Lancer avec : python -m pytest -q test_api_features.py
+"""
+import csv
+import gzip
+import io
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import app as app_module
+from app import SingleFlight, app
+
+
+def run_concurrently(count, target):
+    barrier = threading.Barrier(count)
+    results, errors = [], []
+
+    def worker():
+        barrier.wait()
+        try:
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return results, errors
+
+
+# -----------------------------
+# Agrégats précalculés
+# -----------------------------
+def test_aggregates_count_shared_descendants_once():
+    # Losange : D descend de A par B et par C
+    manager = app_module.FamilyDataManager({
+        "A": {"enfants": ["B", "C"]}, "B": {"enfants": ["D"]}, "C": {"enfants": ["D"]}, "D": {"conjoints": ["E"]}, "E": {}
+    })
+    assert manager.get_aggregates("A") == {"descendant_count": 3, "ancestor_count": 0, "max_depth_below": 2, "spouse_count": 0}
+    assert manager.get_aggregates("D") == {"descendant_count": 0, "ancestor_count": 3, "max_depth_below": 0, "spouse_count": 1}
+
+
+AGGREGATE_FIELDS = {"descendant_count", "ancestor_count", "max_depth_below", "spouse_count"}
+
+
+def test_aggregates_exposed_in_payloads():
+    client = app.test_client()
+    person = client.get("/api/person/Birame Medor Diop").get_json()
+    assert AGGREGATE_FIELDS <= person.keys()
+    assert person["descendant_count"] == app_module.family_manager.get_aggregates("Birame Medor Diop")["descendant_count"]
+
+    assert all(AGGREGATE_FIELDS <= n.keys() for n in client.get("/api/tree").get_json()["nodes"])
+    assert all(AGGREGATE_FIELDS <= n.keys() for n in client.get("/api/descendants/Daro Wade").get_json()["nodes"])
+    hierarchical = client.get("/api/hierarchical-tree").get_json()
+    assert all(AGGREGATE_FIELDS <= p.keys() for p in hierarchical["personnes"])
+    assert AGGREGATE_FIELDS <= hierarchical["hierarchy"][0].keys()
+    assert AGGREGATE_FIELDS <= client.get("/api/hierarchical-tree-limited").get_json()["hierarchy"][0].keys()
+
+
+# -----------------------------
+# Coalescence (single-flight)
+# -----------------------------
+def test_single_flight_coalesces_concurrent_callers():
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.3)
+        return {"value": len(calls)}
+
+    flight = SingleFlight()
+    results, errors = run_concurrently(10, lambda: flight.do("key", slow))
+    assert not errors
+    assert len(calls) == 1
+    assert results == [{"value": 1}] * 10
+
+
+def test_single_flight_shares_errors_with_waiters():
+    calls = []
+
+    def failing():
+        calls.append(1)
+        time.sleep(0.3)
+        raise ValueError("boom")
+
+    flight = SingleFlight()
+    results, errors = run_concurrently(5, lambda: flight.do("key", failing))
+    assert len(calls) == 1
+    assert not results
+    assert len(errors) == 5 and all(isinstance(e, ValueError) for e in errors)
+
+
+@pytest.mark.skipif(app_module.fcntl is None, reason="flock indisponible")
+def test_single_flight_across_workers(tmp_path):
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.3)
+        return {"value": "shared"}
+
+    # Deux instances = deux workers : flock s'applique par descripteur ouvert
+    workers = [SingleFlight(str(tmp_path)), SingleFlight(str(tmp_path))]
+    index = iter(range(2))
+    results, errors = run_concurrently(2, lambda: workers[next(index)].do("key", slow))
+    assert not errors
+    assert len(calls) == 1
+    assert results == [{"value": "shared"}] * 2
+
+
+@pytest.mark.skipif(app_module.fcntl is None, reason="flock indisponible")
+def test_single_flight_without_waiter_writes_nothing(tmp_path):
+    flight = SingleFlight(str(tmp_path))
+    assert flight.do("key", lambda: {"value": 1}) == {"value": 1}
+    assert not list(tmp_path.glob("*.json"))
+
+
+def test_stats_endpoint_coalesces_identical_requests(monkeypatch):
+    calls = []
+    original = app_module.family_manager.get_stats
+
+    def slow_stats(budget=None):
+        calls.append(1)
+        time.sleep(0.3)
+        return original(budget)
+
+    monkeypatch.setattr(app_module.family_manager, "get_stats", slow_stats)
+    results, errors = run_concurrently(8, lambda: app.test_client().get("/api/stats"))
+    assert not errors
+    assert len(calls) == 1
+    assert {r.status_code for r in results} == {200}
+    assert len({r.get_data() for r in results}) == 1
+
+
+# -----------------------------
+# Export en flux
+# -----------------------------
+def parse_gedcom(text):
+    """{xref: (type, [(balise, valeur), ...])} pour les enregistrements de niveau 0."""
+    records, current = {}, None
+    for line in text.splitlines():
+        level, rest = line.split(" ", 1)
+        if level == "0":
+            parts = rest.split(" ")
+            current = records.setdefault(parts[0], (parts[1], [])) if len(parts) == 2 else None
+        elif level == "1" and current is not None:
+            tag, _, value = rest.partition(" ")
+            current[1].append((tag, value))
+    return records
+
+
+def assert_gedcom_consistent(text):
+    records = parse_gedcom(text)
+    individuals = {x: r[1] for x, r in records.items() if r[0] == "INDI"}
+    families = {x: r[1] for x, r in records.items() if r[0] == "FAM"}
+    for xref, fields in families.items():
+        tags = [t for t, _ in fields]
+        assert tags.count("HUSB") <= 1 and tags.count("WIFE") <= 1
+        for tag, value in fields:
+            if tag in ("HUSB", "WIFE"): assert ("FAMS", xref) in individuals[value]
+            if tag == "CHIL": assert ("FAMC", xref) in individuals[value]
+    for xref, fields in individuals.items():
+        for tag, value in fields:
+            if tag == "FAMS": assert ("HUSB", xref) in families[value] or ("WIFE", xref) in families[value]
+            if tag == "FAMC": assert ("CHIL", xref) in families[value]
+    return individuals, families
+
+
+@pytest.mark.parametrize("fmt", ["graphml", "csv", "gedcom"])
+@pytest.mark.parametrize("query", ["", "person=Gabar Diop&direction=ancestors", "person=Gabar Diop&direction=descendants"])
+def test_export_gzip_matches_plain_output(fmt, query):
+    client = app.test_client()
+    plain = client.get(f"/api/export/{fmt}?{query}")
+    compressed = client.get(f"/api/export/{fmt}?{query}&gzip=1")
+    assert plain.status_code == compressed.status_code == 200
+    assert compressed.mimetype == "application/gzip"
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+
+
+def test_export_graphml_parses_and_matches_tree():
+    tree = app.test_client().get("/api/tree").get_json()
+    root = ET.fromstring(app.test_client().get("/api/export/graphml").get_data())
+    ns = {"g": "http://graphml.graphdrawing.org/xmlns"}
+    assert len(root.findall(".//g:node", ns)) == len(tree["nodes"])
+    assert len(root.findall(".//g:edge", ns)) == len(tree["links"])
+
+
+def test_export_csv_edges_match_tree_links():
+    tree = app.test_client().get("/api/tree").get_json()
+    rows = list(csv.DictReader(io.StringIO(app.test_client().get("/api/export/csv").get_data(as_text=True))))
+    assert {(r["source"], r["target"], r["type"]) for r in rows} == \
+        {(l["source"], l["target"], l["type"]) for l in tree["links"]}
+    assert len(rows) == len(tree["links"])
+
+
+def test_export_subset_matches_ancestors_endpoint():
+    client = app.test_client()
+    ancestors = client.get("/api/ancestors/Gabar Diop").get_json()
+    rows = list(csv.DictReader(io.StringIO(
+        client.get("/api/export/csv?person=Gabar Diop&direction=ancestors").get_data(as_text=True))))
+    assert len(rows) == len(ancestors["links"])
+
+
+def test_export_gedcom_cross_references_are_consistent():
+    text = app.test_client().get("/api/export/gedcom").get_data(as_text=True)
+    individuals, families = assert_gedcom_consistent(text)
+    assert len(individuals) == len(app_module.family_manager.data)
+    assert text.startswith("0 HEAD") and text.endswith("0 TRLR\n")
+
+
+def test_export_gedcom_limits_families_to_two_roles():
+    # Trois parents, dont deux hommes : un seul HUSB et une seule WIFE, sans FAMS orphelin
+    manager = app_module.FamilyDataManager({
+        "P1": {"genre": "Homme", "enfants": ["E"]}, "P2": {"genre": "Homme", "enfants": ["E"]},
+        "P3": {"genre": "Femme", "enfants": ["E"]}, "E": {"genre": "Femme"},
+        "M1": {"genre": "Femme", "conjoints": ["M2"]}, "M2": {"genre": "Femme"},
+    })
+    assert_gedcom_consistent("".join(manager.iter_export("gedcom")))
+
+
+@pytest.mark.parametrize("url, status", [
+    ("/api/export/pdf", 400),
+    ("/api/export/csv?person=Personne Inconnue", 404),
+    ("/api/export/csv?person=Gabar Diop&direction=sideways", 400),
+])
+def test_export_errors(url, status):
+    assert app.test_client().get(url).status_code == status
+
+
+def test_encode_stream_groups_small_chunks():
+    blocks = list(app_module.encode_stream(("x" * 20 for _ in range(10000)), compress=False))
+    assert b"".join(blocks) == b"x" * 200000
+    assert all(len(b) >= app_module.EXPORT_CHUNK_SIZE for b in blocks[:-1])
+    assert len(blocks) == 200000 // app_module.EXPORT_CHUNK_SIZE + 1
+
+
+def test_export_cli(tmp_path):
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=["export", "--format", "csv"])
+    assert result.exit_code == 0
+    assert result.stdout_bytes == app.test_client().get("/api/export/csv").get_data()
+
+    output = tmp_path / "arbre.ged.gz"
+    result = runner.invoke(args=["export", "--format", "gedcom", "--person", "Gabar Diop", "--gzip", "-o", str(output)])
+    assert result.exit_code == 0
+    assert_gedcom_consistent(gzip.decompress(output.read_bytes()).decode("utf-8"))
+
+    assert runner.invoke(args=["export", "--person", "Personne Inconnue"]).exit_code != 0
+
+
+# -----------------------------
+# Index d'accessibilité
+# -----------------------------
+def test_reachability_index_matches_unbounded_bfs():
+    manager = app_module.family_manager
+    for person in manager.data:
+        for direction in ("ancestors", "descendants"):
+            assert manager._get_related_people(person, direction) == \
+                manager._get_related_people(person, direction, max_depth=len(manager.data))
+
+
+def test_is_ancestor_endpoint():
+    client = app.test_client()
+    data = client.get("/api/is-ancestor?ancestor=Daro Wade&descendant=Gabar Diop").get_json()
+    assert data["is_ancestor"] and data["generations"] == 3
+    reverse = client.get("/api/is-ancestor?ancestor=Gabar Diop&descendant=Daro Wade").get_json()
+    assert not reverse["is_ancestor"] and reverse["generations"] is None
+
+
+CYCLIC_DATA = [
+    # Cycle A ↔ B suivi d'un descendant hors cycle
+    {"X": {}, "A": {"enfants": ["B"]}, "B": {"enfants": ["A", "X"]}},
+    # Cycle de trois personnes entre une racine et une lignée
+    {"R": {"enfants": ["C1"]}, "C1": {"enfants": ["C2"]}, "C2": {"enfants": ["C3"]}, "C3": {"enfants": ["C1", "Y"]},
+     "Y": {"enfants": ["Z"]}, "Z": {}, "W": {"enfants": ["Z"]}},
+]
+
+
+@pytest.mark.parametrize("data", CYCLIC_DATA)
+def test_reachability_index_matches_bfs_on_cyclic_data(data):
+    manager = app_module.FamilyDataManager(data)
+    for person in manager.data:
+        for direction in ("ancestors", "descendants"):
+            expected = manager._get_related_people(person, direction, max_depth=len(manager.data))
+            assert manager._get_related_people(person, direction) == expected
+            count = manager.get_aggregates(person)["ancestor_count" if direction == "ancestors" else "descendant_count"]
+            assert count == len(expected - {person})
+
+
+def test_cycle_does_not_hide_downstream_descendants():
+    manager = app_module.FamilyDataManager(CYCLIC_DATA[0])
+    assert manager.is_ancestor("A", "X") and manager.is_ancestor("B", "X")
+    assert manager.generation_distance("A", "X") == 2
+    assert manager.get_aggregates("A")["max_depth_below"] == 1
+
+
+# -----------------------------
+# Budgets de travail
+# -----------------------------
+def test_over_budget_output_is_flagged_or_413_when_strict():
+    client = app.test_client()
+    partial = client.get("/api/hierarchical-tree?max_output=5").get_json()
+    assert partial["budget"]["truncated"] and partial["budget"]["reason"] == "max_output"
+    assert partial["budget"]["output"] == 5
+
+    strict = client.get("/api/hierarchical-tree?max_output=5&strict=1")
+    assert strict.status_code == 413
+    assert "hint" in strict.get_json()
+
+
+def test_over_budget_deadline_returns_503_when_strict():
+    response = app.test_client().get("/api/stats?timeout=0.000001&strict=1")
+    assert response.status_code == 503
+    assert response.get_json()["budget"]["reason"] == "deadline"
+
+
+def test_tree_budget_reports_nodes_actually_returned():
+    payload = app.test_client().get("/api/tree?max_output=7").get_json()
+    assert len(payload["nodes"]) == payload["budget"]["output"] == 7
+
+
+def test_export_over_budget_reports_kept_people():
+    response = app.test_client().get("/api/export/csv?person=Daro Wade&max_output=2")
+    assert response.status_code == 413
+    assert response.get_json()["budget"]["output"] == 2
+
+
+def test_relation_path_over_budget_returns_413():
+    response = app.test_client().get("/api/relation-path?person1=Katy&person2=Gabar Diop&max_nodes=1")
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize("value", ["nan", "inf", "-inf"])
+def test_non_finite_timeout_falls_back_to_server_cap(value):
+    response = app.test_client().get(f"/api/tree?timeout={value}")
+    assert response.status_code == 200
+    assert b"NaN" not in response.get_data() and b"Infinity" not in response.get_data()
+    assert response.get_json()["budget"]["limits"]["timeout"] == app_module.REQUEST_TIMEOUT
+
+
+def assert_connected_to(person, payload):
+    """Chaque nœud partiel est relié à `person` par les liens parent renvoyés."""
+    ids = {n["id"] for n in payload["nodes"]}
+    neighbours = {n: set() for n in ids}
+    for link in payload["links"]:
+        if link["type"] == "parent":
+            neighbours[link["source"]].add(link["target"])
+            neighbours[link["target"]].add(link["source"])
+    seen, stack = {person}, [person]
+    while stack:
+        for other in neighbours[stack.pop()] - seen:
+            seen.add(other)
+            stack.append(other)
+    assert seen == ids
+
+
+@pytest.mark.parametrize("direction, person", [("ancestors", "Mame Diarra Diop"), ("descendants", "Daro Wade")])
+@pytest.mark.parametrize("limit", [2, 3, 5, 10])
+def test_partial_subsets_stay_connected(direction, person, limit):
+    payload = app.test_client().get(f"/api/{direction}/{person}?max_output={limit}").get_json()
+    assert payload["budget"]["truncated"]
+    assert len(payload["nodes"]) == payload["budget"]["output"] == limit
+    assert_connected_to(person, payload)
+
+
+# -----------------------------
+# Requêtes spatiales
+# -----------------------------
+def test_viewport_matches_brute_force_clipping():
+    manager = app_module.family_manager
+    bounds = manager.get_layout_bounds()
+    x1, y1 = bounds["x1"] / 2, bounds["y1"] / 2
+    payload = app.test_client().get(f"/api/tree/viewport?x0=0&y0=0&x1={x1}&y1={y1}&zoom=1").get_json()
+    expected = {n for n, (x, y) in manager.layout.items() if 0 <= x <= x1 and 0 <= y <= y1}
+    assert not payload["lod"]
+    assert {n["id"] for n in payload["nodes"]} == expected
+
+
+def test_viewport_clusters_at_low_zoom():
+    bounds = app_module.family_manager.get_layout_bounds()
+    payload = app.test_client().get(
+        f"/api/tree/viewport?x0={bounds['x0']}&y0={bounds['y0']}&x1={bounds['x1']}&y1={bounds['y1']}&zoom=0.2").get_json()
+    assert payload["lod"]
+    assert sum(n["count"] for n in payload["nodes"]) == len(app_module.family_manager.data)
+
+
+@pytest.mark.parametrize("query", [
+    "x0=nan&y0=0&x1=100&y1=100",
+    "x0=-inf&y0=0&x1=100&y1=100",
+    "x0=0&y0=0&x1=100&y1=inf",
+    "x0=0&y0=0&x1=100&y1=100&zoom=nan",
+    "x0=0&y0=0&x1=100&y1=100&zoom=0",
+    "x0=0&y0=0&x1=100&y1=100&zoom=abc",
+    "x0=0&y0=0&x1=100&y1=100&zoom=",
+    "x0=abc&y0=0&x1=100&y1=100",
+    "x0=0&y0=0&x1=100",
+])
+def test_viewport_rejects_invalid_parameters(query):
+    assert app.test_client().get(f"/api/tree/viewport?{query}").status_code == 400
+
+
+def test_viewport_zoom_defaults_to_one_when_absent():
+    payload = app.test_client().get("/api/tree/viewport?x0=0&y0=0&x1=100&y1=100").get_json()
+    assert payload["viewport"]["zoom"] == 1.0 and not payload["lod"]